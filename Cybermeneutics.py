@@ -36,52 +36,118 @@
 
 # Options should be set in the main function, which is called when the script 
 # is run. To modify the parameters of the Corpus class, you can change the
-# arguments in the main function at the bottom of the script (line 730).
+# arguments in the main function at the bottom of the script.
+
+import bisect
+import functools
+import hashlib
+import importlib.util
+import json
+import multiprocessing as mp
+import os
+import re
+import subprocess
+import sys
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+# Regexes used in the hot loops are compiled once for the whole run
+_YAML_RE = re.compile(r'\A\ufeff?\s*---(.*?)---(.*)\Z', re.DOTALL) # YAML front matter (after an optional byte order mark) and the text that follows
+_LINK_RE = re.compile(r'\[\[[^\]]*?\]\]') # Existing [[...]] links
+_PARA_SPLIT = re.compile(r'\n\n+') # Paragraph breaks
+_HONORIFICS = frozenset({"Mr.", "Mrs.", "Ms."}) # Entities that are never kept
+_PUNCTUATION_DELETE = str.maketrans("", "", "-'.") # Characters not counted in the length of an entity
+_ENTITY_LABELS = frozenset({"PERSON", "ORG", "GPE", "LOC", "FAC", "NORP", "DATE", "WORK_OF_ART", "PRODUCT"}) # Entity types kept in the dictionary
+_TEXT_EXTENSIONS = frozenset({".txt", ".md"}) # Files read from the data folder
+_PARALLEL_MIN_FILES = 64 # Below this number of files, starting worker processes costs more than it saves
+_MAX_PENDING_WRITES = 256 # Pages built by generate but not written yet
+_UNUSED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer"] # Components not loaded with the model
+_NER_PIPES = ("tok2vec", "transformer", "ner") # Components needed for named entity recognition
+
+# Typographic characters normalised by Corpus._clean_text
+_CLEAN_TABLE = str.maketrans({
+    "—": "--", # Em dash to double hyphen
+    "–": "-", # En dash to hyphen
+    "…": "...", # Ellipsis to three periods
+    "‘": "'", # Left single quote to apostrophe
+    "’": "'", # Right single quote to apostrophe
+    "“": "\"", # Left double quote to double quote
+    "”": "\"", # Right double quote to double quote
+    "`": "'", # Backticks to apostrophe
+})
+# Double hyphens (but not "---") get a space on each side, and runs of spaces become one space
+_CLEAN_RE = re.compile(r' *(?<!-)--(?!-) *| {2,}')
+
+def _clean_match(match):
+    """Replacement of a _CLEAN_RE match: a spaced double hyphen or a single space"""
+    return " -- " if "-" in match.group(0) else " "
+
+@functools.lru_cache(maxsize = 1024)
+def _terms_pattern(surfaces):
+    """
+        Returns the case-insensitive regex matching any of the surfaces (keys with spaces) in a text, followed by an optional possessive ('s or ').
+
+        The longest surfaces come first, so the longest match wins at a given position. Files with the same terms share the compiled regex.
+        """
+    escaped = "|".join(re.escape(surface) for surface in sorted(surfaces, key = len, reverse = True))
+    return re.compile(r'\b(' + escaped + r")(?:'s\b|'(?!\w)|\b)", re.IGNORECASE)
 
 class Corpus:
     def __init__(self, path, sample = True, model_name = "en_core_web_sm", 
                     min_sources = 4, min_count = 20):
-        import subprocess
-        import sys
-        from tqdm import tqdm
         requirements = ["spacy"]
 
-        print("""Downloading the required libraries...""")
+        print("""Checking the required libraries...""")
         for req in requirements:
-            # Check the the operating system and install the library accordingly
-            if sys.platform.startswith("win"):
-                subprocess.check_call([sys.executable, "-m", "pip", "install", req])
-            elif sys.platform.startswith("linux") or sys.platform.startswith("darwin"):
-                subprocess.check_call([sys.executable, "-m", "pip", "install", req])
-            elif sys.platform.startswith("macos"):
+            # Only the missing libraries are installed
+            if importlib.util.find_spec(req) is None:
+                print(f"Installing {req}...")
                 subprocess.check_call([sys.executable, "-m", "pip", "install", req])
-            else:
-                print(f"Unsupported operating system: {sys.platform}. Please install {req} manually.")
-                return
+                # The import system caches the content of the folders it already searched,
+                # so it has to forget them to see the library installed while running
+                importlib.invalidate_caches()
         
         print("""Importing the relevant libraries...""")
         import spacy
-        import os
 
-        print("""Downloading the model...""")
+        self.gpu = False
         try:     
-            # Check the operating system and download the model accordingly
-            if sys.platform.startswith("win"):
-                subprocess.check_call([sys.executable, "-m", "spacy", "download", model_name])
-            elif sys.platform.startswith("linux") or sys.platform.startswith("darwin"):
+            # The model is only downloaded if it is not installed yet
+            if not spacy.util.is_package(model_name):
+                print("""Downloading the model...""")
                 subprocess.check_call([sys.executable, "-m", "spacy", "download", model_name])
-            elif sys.platform.startswith("macos"):
-                subprocess.check_call([sys.executable, "-m", "spacy", "download", model_name])
-            else:
-                print(f"Unsupported operating system: {sys.platform}. Please download the model manually.")
-                return
-            print("""Model downloaded successfully.""")
+                print("""Model downloaded successfully.""")
+            # Transformer models are run on the GPU when CuPy and a GPU are available
+            self.gpu = model_name.endswith("_trf") and spacy.prefer_gpu()
+            if self.gpu:
+                print("""Using the GPU for the transformer model...""")
             print("""Loading the model...""")
-            nlp = spacy.load(model_name)
+            # Only the named entity recognizer is used, the other components are not loaded
+            nlp = None
+            if self.gpu:
+                # Mixed precision halves the memory traffic of the transformer on the GPU,
+                # older spacy-transformers versions do not have the option
+                try:
+                    nlp = spacy.load(model_name, exclude = _UNUSED_PIPES,
+                                     config = {"components.transformer.model.mixed_precision": True})
+                except Exception:
+                    nlp = None
+            if nlp is None:
+                nlp = spacy.load(model_name, exclude = _UNUSED_PIPES)
         except:
-            print("""Model not found, downloading the default model...""")
-            subprocess.check_call([sys.executable, "-m", "spacy", "download", "en_core_web_sm"])
-            nlp = spacy.load("en_core_web_sm")
+            print("""Model not found, using the default model...""")
+            if not spacy.util.is_package("en_core_web_sm"):
+                subprocess.check_call([sys.executable, "-m", "spacy", "download", "en_core_web_sm"])
+            model_name = "en_core_web_sm"
+            # The small model runs on the CPU, in several processes (see _pipe_settings)
+            if self.gpu:
+                spacy.require_cpu()
+            self.gpu = False
+            nlp = spacy.load("en_core_web_sm", exclude = _UNUSED_PIPES)
+        # Any other component of the model (morphologizer, senter, ...) is disabled as well, so a
+        # transformer model only runs the transformer and the named entity recognizer
+        nlp.select_pipes(enable = [pipe for pipe in nlp.pipe_names if pipe in _NER_PIPES])
 
         self.data_path = path + "/data"
         self.viewer_path = path + "/viewer"
@@ -91,8 +157,14 @@ class Corpus:
         self.model_name = model_name
         self.sample = sample
         self.dictionary = {}
+        # The dictionary is built from these structures of arrays, one mapping per field
+        self.counts = defaultdict(Counter) # key -> file -> count
+        self.totals = Counter() # key -> count in the whole corpus
+        self.types = {} # key -> entity type (or LIST)
+        self.originals = {} # key -> text to display
         self.model = nlp
         self.word_list = []
+        self._dirs = set() # Directories already created by _create_file or _ensure_dirs
         print("Initializing...")
         self.initialize()
         print("You can now add your files to the data folder.")
@@ -114,25 +186,32 @@ class Corpus:
             print("There was an issue with the initialisation of the file structure")
     
     def _create_file(self, path, content):
-        import os
-        directory = os.path.dirname(path)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
         path = path.replace("\"", "")
         path = path.replace("'", "")
+        # Each directory is only created (or checked) once per run
+        directory = os.path.dirname(path)
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok = True)
+            self._dirs.add(directory)
+        # Content already encoded (the viewer pages) is written as is
+        if isinstance(content, bytes):
+            with open(path, "wb") as f:
+                f.write(content)
+            return True
         with open(path, "w", encoding="utf-8") as f:
             f.write(content)
         return True
 
+    def _ensure_dirs(self, paths):
+        """Creates the directories of all the given file paths at once, so that _create_file does not have to"""
+        for directory in {os.path.dirname(path.replace("\"", "").replace("'", "")) for path in paths} - self._dirs:
+            os.makedirs(directory, exist_ok = True)
+            self._dirs.add(directory)
+
     def _starting_files(self):
-        import os
         print("""Creating the file structure...""")
-        if not os.path.exists(self.path):
-            os.mkdir(self.path)
-        if not os.path.exists(self.data_path):
-            os.mkdir(self.data_path)
-        if not os.path.exists(self.viewer_path):
-            os.mkdir(self.viewer_path)
+        os.makedirs(self.data_path, exist_ok = True)
+        os.makedirs(self.viewer_path, exist_ok = True)
         
         print("""Creating the readme.txt file...""")
         readme_path = self.path + "/readme.txt"
@@ -177,6 +256,8 @@ When ready, press 'y' and then enter to continue. You can at any time stop this
 
 Before pressing 'y', first add the ```.md``` or ```.txt``` files you want to study in the ```/data``` folder. If these files are logically ordered in folders, you should copy that architecture in the data folder as it will be replicated in the viewer. 
 
+The entities found in each paragraph are saved in a ```.cache``` folder, so running the software again on the same files with the same model skips the named entity recognition for the paragraphs that did not change. The folder also keeps track of the viewer pages already written, so the pages whose content did not change are not written again. You can delete this folder at any time to start from scratch.
+
 #### How to use a virtual environment
 
 To create a virtual environment, you can use the following commands:
@@ -210,6 +291,8 @@ List of parameters:
 - ```min_sources```: The minimum number of sources in which an entity must appear to be included in the index cards. (Default is 2);
 - ```min_count```: The minimum number of times an entity must appear in the corpus to be included in the index cards. (Default is 10).
 
+The paragraphs are sent to SpaCy in batches, using several processes on large corpora. The size of the batches and the number of processes are chosen from the model and the number of processors, and can be set with the ```CYBERMENEUTICS_BATCH_SIZE``` and ```CYBERMENEUTICS_N_PROCESS``` environment variables.
+
 #### Custom list 
 
 When you initialize the program, an empty file named ```list.txt``` is created. Terms saved in this list will be treated as entities, and index cards will be created for the terms. To use a custom list, enter one word per line in the file, and save the file before processing the files.
@@ -293,8 +376,8 @@ Cybermeneutics was coded on VS Code with limited use of AI tools, specifically f
             print("There was an issue with the initialisation of the file structure (list.txt was not created).")
             return False
 
-        print("""Creating the .obsidian folder and file""")
-        obs_path = self.viewer_path + "./obsidian/graph.json"
+        # The graph settings go in the .obsidian folder of the vault, and the ones the user changed in Obsidian are kept
+        obs_path = os.path.join(self.viewer_path, ".obsidian", "graph.json")
         obs_content = """{
   "collapse-filter": true,
   "search": "",
@@ -353,22 +436,26 @@ Cybermeneutics was coded on VS Code with limited use of AI tools, specifically f
   "scale": 0.20640086681036243,
   "close": false
 }"""
-        if self._create_file(obs_path, obs_content):
-            pass
-        else:
-            print("There was an issue with the initialisation of the file structure (.obsidian/graph.json was not created).")
-            return False
+        if not os.path.exists(obs_path):
+            print("""Creating the .obsidian folder and file""")
+            if self._create_file(obs_path, obs_content):
+                pass
+            else:
+                print("There was an issue with the initialisation of the file structure (.obsidian/graph.json was not created).")
+                return False
 
-        print("""Creating the empty dictionary file...""")
+        # The dictionary of a previous run is kept, so that _save_dictionary can skip writing it again when nothing changed
         dict_path = self.path + "/dictionary.json"
-        dict_content = """
+        if not os.path.exists(dict_path):
+            print("""Creating the empty dictionary file...""")
+            dict_content = """
         {}
         """
-        if self._create_file(dict_path, dict_content):
-            pass
-        else:
-            print("There was an issue with the initialisation of the file structure (dictionary.json was not created).")
-            return False
+            if self._create_file(dict_path, dict_content):
+                pass
+            else:
+                print("There was an issue with the initialisation of the file structure (dictionary.json was not created).")
+                return False
 
         if self.sample:
             print("""Creating the sample file...""")
@@ -392,45 +479,38 @@ This is an example of a novel with named characters like Jacob Williamson and Wi
     def _create_entity_link(self, ent_type, string):
         return f"[[ENTITY/{ent_type}/{string}|{string}]]"
 
-    def _remove_path_from_title(self, path):
-        instances_of_slash = []
-        for i in range(len(path)):
-            if path[i] == "/":
-                instances_of_slash.append(i)
-        if len(instances_of_slash) > 0:
-            path = path[instances_of_slash[-1] + 1:len(path)]
-        return path
-
     def _create_file_link(self, path, title):
-        # Create relative path from viewer entity files back to viewer text files
-        relative_path = path.replace(self.data_path + "\\", "")
-        relative_path = relative_path.replace(".txt", "")
-        relative_path = relative_path.replace(".md", "")
-        relative_path = relative_path.replace("\\", "/")
-        title = self._remove_path_from_title(title)
-        return f"[[FILES/{relative_path}|{title}]]"
+        # Create relative path from viewer entity files back to viewer text files,
+        # with forward slashes and without the extension on every system
+        relative_path = Path(path).relative_to(self.data_path).with_suffix("").as_posix()
+        return f"[[FILES/{relative_path}|{Path(title).name}]]"
 
     def _read_word_list(self):
         with open(self.path + "/list.txt", "r", encoding="utf-8") as f:
             content = f.read().strip()
             if content:
-                self.word_list = [word.strip().lower() for word in content.split("\n") if word.strip()]
+                # Repeated words are only kept once, in the order of the list
+                self.word_list = list(dict.fromkeys(word.strip().lower() for word in content.split("\n") if word.strip()))
             else:
                 self.word_list = []
         return self.word_list
 
     def _find_text_files(self, folder_path):
-        import os
+        # Walks the folder with os.scandir, which gives the type of each entry without another stat call
         text_files = []
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if file.endswith(".txt") or file.endswith(".md"):
-                    text_files.append(os.path.join(root, file))
-        return text_files
+        folders = [folder_path]
+        while folders:
+            with os.scandir(folders.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks = False):
+                        folders.append(entry.path)
+                    elif os.path.splitext(entry.name)[1] in _TEXT_EXTENSIONS and entry.is_file():
+                        text_files.append(entry.path)
+        return sorted(text_files)
 
     def _extract_yaml_and_text(self, input_string):
         """
-            Extracts the yaml from a string (from the first "---" to the second "---" of the string) and returns the yaml and the text that has been stripped of the yaml.
+            Extracts the yaml from a string (from the "---" that opens the string to the next "---") and returns the yaml and the text that has been stripped of the yaml.
 
             Args:
                 input_string: The input string potentially containing YAML front matter.
@@ -438,40 +518,25 @@ This is an example of a novel with named characters like Jacob Williamson and Wi
             Returns:
                 A tuple containing two strings: the extracted YAML (or None if not found) and the text without the YAML.
             """
-        start = input_string.find("---")
-        if start == -1:
-            return None, input_string
-
-        end = input_string.find("---", start + 3)
-        if end == -1:
+        match = _YAML_RE.match(input_string)
+        if match is None:
             return None, input_string
 
-        yaml_content = input_string[start + 3 : end].strip()
-        text_content = input_string[end + 3 :].strip()
+        yaml_content = match.group(1).strip()
+        text_content = match.group(2).strip()
 
         return yaml_content, text_content
 
     def _filter_dictionary(self, token):
-        import spacy
         # Filters the dictionary to remove unwanted tokens.
         # FIXED: Don't filter out words that are in the word list - they should be processed
-        if isinstance(token, spacy.tokens.Token):
-            if token.is_stop:
-                return False
-        
-        if hasattr(token, 'text'):
-            text = token.text
-        else:
-            text = str(token)
-            
-        if "\n" in text:
+        # Accepts a SpaCy token (stop words are removed) or the text of an entity
+        if getattr(token, "is_stop", False):
             return False
+        text = getattr(token, "text", token)
         
         # Clean text for length check
-        clean_text = text.replace("-", "").replace("'", "").replace(".", "")
-        if len(clean_text) < 2:
-            return False
-        if clean_text in ["Mr.", "Mrs.", "Ms."]:
+        if "\n" in text or len(text.translate(_PUNCTUATION_DELETE)) < 2 or text in _HONORIFICS:
             return False
         return True 
 
@@ -485,18 +550,30 @@ This is an example of a novel with named characters like Jacob Williamson and Wi
         return text
 
     def _clean_text(self, text):
-        text = text.replace("-", "--")  # Em dash to double hyphen
-        text = text.replace("-", "-")  # En dash to hyphen
-        text = text.replace("--", " -- ") # Insure space around em-dashes and double dashes
-        text = text.replace("  ", " ") # Double space to single space
-        text = text.replace(".", "...")  # Ellipsis to three periods
-        text = text.replace("’", "'")  # Left single quote to apostrophe
-        text = text.replace("'", "'")  # Right single quote to apostrophe
-        text = text.replace('“', "\"")  # Left double quote to double quote
-        text = text.replace("”", "\"")
-        text = text.replace("`", "'")  # Backticks to apostrophe
+        # Single characters are replaced in one pass with a translation table,
+        # then dashes and spaces are normalised with one regex
+        text = text.translate(_CLEAN_TABLE)
+        # The regex only has something to do if the text has a double hyphen or a double space
+        if "--" in text or "  " in text:
+            text = _CLEAN_RE.sub(_clean_match, text)
         return text
 
+    def _read_text(self, path):
+        """Reads a whole text file in one call"""
+        return Path(path).read_text(encoding = "utf-8")
+
+    def _prepare_text(self, text):
+        """Cleans a raw text and returns its yaml (or None) and its body, see _clean_text and _extract_yaml_and_text"""
+        return self._extract_yaml_and_text(self._clean_text(text))
+
+    def _prepare_file(self, text_file, raw = None):
+        """Reads a file (unless its raw text is given) and returns its path, its raw text, its paragraphs and the counts of the word list terms"""
+        if raw is None:
+            raw = self._read_text(text_file)
+        yaml, text = self._prepare_text(raw)
+        paragraphs = [paragraph.replace("\n", " ") for paragraph in _PARA_SPLIT.split(text)]
+        return text_file, raw, paragraphs, self._count_list_words(text)
+
     def _is_word_in_list(self, word):
         """Check if a word (in various forms) is in the word list"""
         word_lower = word.lower()
@@ -509,224 +586,621 @@ This is an example of a novel with named characters like Jacob Williamson and Wi
             return True
         return False
 
-    def _add_to_dictionary(self, key, text_file, word_type, original_text=None):
+    def _build_word_list_automaton(self):
+        """Builds an Aho-Corasick automaton of the word list, or returns None if pyahocorasick is not installed"""
+        try:
+            import ahocorasick
+        except ImportError:
+            return None
+        if not self.word_list:
+            return None
+        automaton = ahocorasick.Automaton()
+        for word in self.word_list:
+            automaton.add_word(word, (word, len(word), self._is_boundary(word, 0), self._is_boundary(word, len(word))))
+        automaton.make_automaton()
+        return automaton
+
+    def _build_word_list_regex(self):
+        """
+            Compiles the whole word list into one regex matched against lowercased text, or returns None if the list is empty.
+
+            The regex only finds the longest word starting at a given position, so the shorter words of the list that begin that
+            word and end on a word boundary inside it (e.g. "new" in "new york") are kept in self._word_prefixes to be counted too.
+            """
+        self._word_prefixes = {}
+        if not self.word_list:
+            return None
+        # Only the beginnings of a word that end on a word boundary can be words of the list
+        word_set = set(self.word_list)
+        for word in word_set:
+            self._word_prefixes[word] = [word[:i] for i in range(1, len(word)) if self._is_boundary(word, i) and word[:i] in word_set]
+        # Longest words first so that the longest match wins at a given position, and
+        # a lookahead so that overlapping words (e.g. "york" in "new york") are all found.
+        # The words are already lowercase, so the text is lowercased once instead of
+        # folding the case of every character the regex engine compares
+        escaped = sorted(set(re.escape(word) for word in self.word_list), key = len, reverse = True)
+        return re.compile(r'(?=\b(' + '|'.join(escaped) + r')\b)')
+
+    def _is_boundary(self, text, index):
+        """Same as the regex \\b: True if only one of the characters around index is a word character"""
+        before = index > 0 and (text[index - 1].isalnum() or text[index - 1] == "_")
+        after = index < len(text) and (text[index].isalnum() or text[index] == "_")
+        return before != after
+
+    def _count_list_words(self, text):
+        """
+            Counts the occurrences of the words of the word list in a text, ignoring case.
+
+            The text is scanned once for all the words, with pyahocorasick if it is installed or with the compiled word list regex otherwise.
+
+            Args:
+                text: The text to scan.
+
+            Returns:
+                A dictionary mapping each word found in the text to its number of occurrences.
+            """
+        counts = {}
+        # Lowercased as for the links (see _lower), so that the words counted are the ones linked
+        if self._word_automaton is not None:
+            lowered = self._lower(text)
+            padded = " " + lowered + " "
+            # The \b checks are inlined: whether the first and last characters of each word are
+            # word characters is stored in the automaton, so only the neighbours are tested here
+            for end, (word, length, first_is_word, last_is_word) in self._word_automaton.iter(lowered):
+                before = padded[end - length + 1]
+                after = padded[end + 2]
+                if (before.isalnum() or before == "_") != first_is_word and (after.isalnum() or after == "_") != last_is_word:
+                    counts[word] = counts.get(word, 0) + 1
+        elif self._word_regex is not None:
+            for match in self._word_regex.finditer(self._lower(text)):
+                word = match.group(1)
+                counts[word] = counts.get(word, 0) + 1
+                for prefix in self._word_prefixes[word]:
+                    counts[prefix] = counts.get(prefix, 0) + 1
+        return counts
+
+    def _add_to_dictionary(self, key, text_file, word_type, original_text=None, count=1):
         """Helper method to add items to dictionary"""
-        if key not in self.dictionary:
-            self.dictionary[key] = {
-                "counts": {text_file: 1},
-                "type": word_type,
-                "original_text": original_text or key.replace("_", " ")
-            }
+        if key not in self.types:
+            self.types[key] = word_type
+            self.originals[key] = original_text or key.replace("_", " ")
+        self.counts[key][text_file] += count
+        self.totals[key] += count
+
+    def _entity_cache_path(self, paragraph):
+        """Returns the path of the file caching the entities found by the current model in a paragraph"""
+        key = hashlib.blake2b((self.model_name + "\n" + paragraph).encode("utf-8"), digest_size = 16).hexdigest()
+        return Path(self.path) / ".cache" / "ents" / key[:2] / (key + ".json")
+
+    def _read_cache_entry(self, cache_path):
+        """Returns the entities saved in a cache file, or None if there is no file or if it cannot be read (e.g. cut short by an interrupted run)"""
+        try:
+            return json.loads(cache_path.read_text(encoding = "utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache_entry(self, cache_path, ents):
+        """Saves the entities of a paragraph to its cache file, through a temporary file so that an interrupted run never leaves half a file"""
+        cache_path.parent.mkdir(parents = True, exist_ok = True)
+        temp_path = cache_path.with_name(cache_path.name + ".tmp")
+        temp_path.write_text(json.dumps(ents), encoding = "utf-8")
+        os.replace(temp_path, cache_path)
+
+    def _add_entities(self, ents, text_files):
+        """Adds the (text, label) entities found in a paragraph to the dictionary, once for each file in which the paragraph appears"""
+        # The entities are counted once for the paragraph, then added to each file in one call per entity
+        found = Counter()
+        for ent_text, label in ents:
+            if label in _ENTITY_LABELS:
+                # The same entity texts come back in many paragraphs, so they are only filtered and cleaned once
+                entity = self._entity_keys.get(ent_text, False)
+                if entity is False:
+                    entity = None
+                    if self._filter_dictionary(ent_text):
+                        cleaned_entity_text = self._clean_entity_text(ent_text)
+                        entity = (sys.intern(cleaned_entity_text.replace(" ", "_")), cleaned_entity_text)
+                    self._entity_keys[ent_text] = entity
+                if entity is not None:
+                    found[(entity[0], label, entity[1])] += 1
+
+        if not found:
+            return
+        # A paragraph repeated in a file is listed once per occurrence
+        file_counts = Counter(text_files) if len(text_files) > 1 else {text_files[0]: 1}
+        for (ent_key, label, cleaned_entity_text), count in found.items():
+            for text_file, occurrences in file_counts.items():
+                try: 
+                    self._add_to_dictionary(ent_key, text_file, label, cleaned_entity_text, count * occurrences)
+                except Exception as e:
+                    print(f"Error processing entity {cleaned_entity_text}: {e}")
+
+    def _pack_paragraphs(self, paragraphs, max_chars = 2000):
+        """
+            Joins consecutive paragraphs with blank lines into texts of at most max_chars characters (longer paragraphs stay alone).
+
+            Args:
+                paragraphs: A list of (paragraph, context) tuples.
+                max_chars: The maximum length of a packed text.
+
+            Returns:
+                A list of (text, (starts, contexts)) tuples, where starts are the positions of the paragraphs in the text and contexts their contexts.
+            """
+        packs = []
+        texts, starts, contexts = [], [], []
+        length = 0
+        for paragraph, context in paragraphs:
+            if texts and length + 2 + len(paragraph) > max_chars:
+                packs.append(("\n\n".join(texts), (starts, contexts)))
+                texts, starts, contexts = [], [], []
+                length = 0
+            if texts:
+                length += 2
+            starts.append(length)
+            texts.append(paragraph)
+            contexts.append(context)
+            length += len(paragraph)
+        if texts:
+            packs.append(("\n\n".join(texts), (starts, contexts)))
+        return packs
+
+    def _pipe_settings(self, n_texts):
+        """
+            Returns the batch size and number of processes used by nlp.pipe for the current model.
+
+            Both can be overridden with the CYBERMENEUTICS_BATCH_SIZE and CYBERMENEUTICS_N_PROCESS environment variables.
+
+            Args:
+                n_texts: The number of texts that will go through nlp.pipe.
+
+            Returns:
+                A tuple (batch_size, n_process).
+            """
+        cpu_count = os.cpu_count() or 1
+        if not self.model_name.endswith("_trf"):
+            batch_size, n_process = 64, max(1, cpu_count - 1)
+        elif self.gpu:
+            # A single process feeds the GPU, larger batches keep it busy
+            batch_size, n_process = 256, 1
         else:
-            if text_file not in self.dictionary[key]["counts"]:
-                self.dictionary[key]["counts"][text_file] = 1
-            else:
-                self.dictionary[key]["counts"][text_file] += 1
+            # Each process holds its own copy of the transformer, which uses a lot of memory
+            batch_size, n_process = 32, min(4, cpu_count)
+        batch_size = int(os.environ.get("CYBERMENEUTICS_BATCH_SIZE", batch_size))
+        # Every process receives a copy of the model, so there is no point in starting
+        # more processes than there are batches
+        n_process = max(1, min(n_process, n_texts // batch_size))
+        n_process = int(os.environ.get("CYBERMENEUTICS_N_PROCESS", n_process))
+        return batch_size, n_process
 
     def process(self):
         from tqdm import tqdm
-        import re
         print("""Processing the text files...""")
         
         # Read the word list first
         self._read_word_list()
+        self._word_automaton = self._build_word_list_automaton()
+        self._word_regex = self._build_word_list_regex() if self._word_automaton is None else None
         
-        text_files = self._find_text_files(self.data_path)
-        for text_file in tqdm(text_files):
-            with open(text_file, "r", encoding = "utf-8") as f:
-                text = f.read()
-            
-            text = self._clean_text(text)
-            yaml, text = self._extract_yaml_and_text(text)
-            
-            paragraphs = text.split("\n\n")
-
+        # Read, clean, split and scan all the files for the word list before sending the
+        # paragraphs to SpaCy. This is done in worker processes when there are enough files
+        # to pay for starting them. The list of files and their raw texts are kept for
+        # generate, so the files are not read twice
+        self._text_files = self._find_text_files(self.data_path)
+        if len(self._text_files) >= _PARALLEL_MIN_FILES:
+            with ProcessPoolExecutor(initializer = _init_prepare_worker, initargs = (self.word_list,)) as executor:
+                prepared = list(tqdm(executor.map(_prepare_file, self._text_files, chunksize = 4), total = len(self._text_files)))
+        else:
+            # The files are read in threads (reading releases the GIL), so the next files
+            # are being read while the previous ones are prepared
+            with ThreadPoolExecutor(max_workers = 8) as executor:
+                raw_texts = executor.map(self._read_text, self._text_files)
+                prepared = [self._prepare_file(text_file, raw) for text_file, raw in zip(self._text_files, raw_texts)]
+        self._raw_texts = {text_file: raw for text_file, raw, paragraphs, list_counts in prepared}
+
+        # Identical paragraphs (headers, boilerplate...) are only processed once, and
+        # their entities are added for every occurrence
+        self._entity_keys = {} # Entity text -> (key, cleaned text), or None if it is filtered out
+        paragraph_to_files = {}
+        for text_file, raw, paragraphs, list_counts in prepared:
             for paragraph in paragraphs:
-                paragraph = paragraph.replace("\n", " ")
-                doc = self.model(paragraph)
-                for ent in doc.ents:
-                    if ent.label_ in ["PERSON", "ORG", "GPE", "LOC", "FAC", "NORP", "DATE", "WORK_OF_ART", "PRODUCT"]:
-                        cleaned_entity_text = self._clean_entity_text(ent.text)
-                        ent_key = cleaned_entity_text.replace(" ", "_")
-
-                        if self._filter_dictionary(ent):
-                            try: 
-                                self._add_to_dictionary(ent_key, text_file, ent.label_, cleaned_entity_text)
-                            except Exception as e:
-                                print(f"Error processing entity {ent.text}: {e}")
+                if len(paragraph.strip()) >= 3:
+                    paragraph_to_files.setdefault(paragraph, []).append(text_file)
+
+        # Paragraphs already processed by this model are read from the cache. The entities
+        # of all the paragraphs are gathered before being added to the dictionary, so that
+        # they are added in the same order whatever is in the cache
+        paragraph_ents = {}
+        to_process = []
+        for paragraph in paragraph_to_files:
+            cache_path = self._entity_cache_path(paragraph)
+            ents = self._read_cache_entry(cache_path)
+            if ents is not None:
+                paragraph_ents[paragraph] = ents
+            else:
+                to_process.append((paragraph, (paragraph, cache_path)))
+
+        # The others are packed into texts of a few paragraphs to lower the cost per call of the
+        # model and batched through the model with their files as context
+        packs = self._pack_paragraphs(to_process)
+        batch_size, n_process = self._pipe_settings(len(packs))
+        for doc, (starts, contexts) in tqdm(self.model.pipe(packs, as_tuples = True, batch_size = batch_size, n_process = n_process), total = len(packs)):
+            # Each entity goes back to the paragraph it starts in
+            pack_ents = [[] for context in contexts]
+            for ent in doc.ents:
+                pack_ents[bisect.bisect_right(starts, ent.start_char) - 1].append((ent.text, ent.label_))
+            for ents, (paragraph, cache_path) in zip(pack_ents, contexts):
+                paragraph_ents[paragraph] = ents
+                self._write_cache_entry(cache_path, ents)
+
+        # The entities are added in the order of the paragraphs in the files
+        for paragraph, files in paragraph_to_files.items():
+            self._add_entities(paragraph_ents[paragraph], files)
+
+        # The key of each word of the list is built (and interned) once, not once per file
+        list_keys = {word: sys.intern(word.lower().replace(" ", "_")) for word in self.word_list}
+        for text_file, raw, paragraphs, list_counts in prepared:
             # Process the word list items
-            for list_word in self.word_list:
-                # Create regex pattern for word boundaries
-                pattern = r'\b' + re.escape(list_word) + r'\b'
-                matches = re.finditer(pattern, text, re.IGNORECASE)
-                
-                match_count = 0
-                for match in matches:
-                    match_count += 1
-                
-                # If we found matches, add to dictionary
-                if match_count > 0:
-                    list_key = list_word.lower().replace(" ", "_")
-                    if list_key not in self.dictionary:
-                        self.dictionary[list_key] = {
-                            "counts": {text_file: match_count},
-                            "type": "LIST",
-                            "original_text": list_word
-                        }
-                    else:
-                        if text_file not in self.dictionary[list_key]["counts"]:
-                            self.dictionary[list_key]["counts"][text_file] = match_count
-                        else:
-                            self.dictionary[list_key]["counts"][text_file] += match_count
+            for list_word, match_count in list_counts.items():
+                self._add_to_dictionary(list_keys[list_word], text_file, "LIST", list_word, match_count)
         
-        for word in self.word_list:
-            list_key = word.lower().replace(" ", "_")
-            if list_key not in self.dictionary:
-                self.dictionary[list_key] = {
-                    "counts": {},
-                    "type": "LIST",
-                    "original_text": word
-                }
+        for word, list_key in list_keys.items():
+            if list_key not in self.types:
+                self.types[list_key] = "LIST"
+                self.originals[list_key] = word
         
         # Save dictionary as a json file
-        import json
-        with open(self.path + "/" + "dictionary.json", "w", encoding="utf-8") as f:
-            json.dump(self.dictionary, f, indent = 4)
+        self.dictionary = self._legacy_dictionary()
+        self._save_dictionary()
         
+        self._compute_eligible()
+        self._build_file_index()
         return True
 
-    def _term_appears_in_file(self, term, file_path):
-        """Check if a term appears in the dictionary for the given file"""
-        if term not in self.dictionary:
+    def _compute_eligible(self):
+        """Computes once the keys that get an index card (the ones that meet the criteria, and the word list terms), as a list of (key, type) in dictionary order"""
+        self._active_terms = [(key, word_type) for key, word_type in self.types.items()
+                              if (len(self.counts[key]) >= self.min_sources and self.totals[key] >= self.min_count) or word_type == "LIST"]
+        return self._active_terms
+
+    def _legacy_dictionary(self):
+        """Zips the counts, types and original texts into the {key: {"counts", "type", "original_text"}} dictionary saved as json"""
+        return {key: {"counts": dict(self.counts[key]), "type": word_type, "original_text": self.originals[key]}
+                for key, word_type in self.types.items()}
+
+    def _save_dictionary(self):
+        """Saves the dictionary to dictionary.json (with orjson if it is installed), unless the file already has the same content"""
+        try:
+            import orjson
+            data = orjson.dumps(self.dictionary, option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+        except ImportError:
+            data = json.dumps(self.dictionary, indent = 2, sort_keys = True, ensure_ascii = False).encode("utf-8")
+        path = Path(self.path) / "dictionary.json"
+        # The old file is only read back when it has the same size
+        if path.exists() and path.stat().st_size == len(data) and path.read_bytes() == data:
             return False
-        
-        file_counts = self.dictionary[term].get("counts", {})
-        return file_path in file_counts
-
-    def _strip_path(self, path):
-        # Returns everything after the last "/"
-        title = path.split("/")[-1]
-        title = path.split("""\\""")[-1]
-        # Returns everything before the last "."
-        return title.split(".")[0]
-
-    def _replace_words(self, text, word, word_type, current_file_path):
-        import re
-        
-        # Check if this term actually appears in the current file
-        if not self._term_appears_in_file(word, current_file_path):
+        path.write_bytes(data)
+        return True
+
+    def _build_file_index(self):
+        """Maps each file to the elements found in it that meet the criteria for an index card"""
+        self._file_to_terms = defaultdict(list)
+        for term, word_type in self._active_terms:
+            for text_file in self.counts[term]:
+                self._file_to_terms[text_file].append(term)
+        return self._file_to_terms
+
+    def _lower(self, text):
+        """Lowercases a text while keeping its length, so that positions in the result match the original text"""
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        # A few characters (e.g. "İ") grow when lowercased, they are left as is
+        return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+    def _build_link_automaton(self, elements):
+        """Builds an Aho-Corasick automaton of the elements (with spaces, lowercased), or returns None if pyahocorasick is not installed"""
+        try:
+            import ahocorasick
+        except ImportError:
+            return None
+        surfaces = {}
+        for element in elements:
+            surfaces.setdefault(element.replace("_", " ").lower(), []).append((element, self._link_start(element)))
+        if not surfaces:
+            return None
+        automaton = ahocorasick.Automaton()
+        for surface, candidates in surfaces.items():
+            automaton.add_word(surface, (len(surface), candidates, self._is_boundary(surface, 0), self._is_boundary(surface, len(surface))))
+        automaton.make_automaton()
+        return automaton
+
+    def _link_spans(self, text):
+        """Returns the sorted (start, end) positions of the [[...]] links of a text, and the list of their starts"""
+        spans = [(match.start(), match.end()) for match in _LINK_RE.finditer(text)]
+        return spans, [start for start, end in spans]
+
+    def _inside_link(self, link_spans, position):
+        """Checks with a binary search if a position falls inside one of the links returned by _link_spans"""
+        spans, starts = link_spans
+        i = bisect.bisect_right(starts, position) - 1
+        return i >= 0 and position < spans[i][1]
+
+    def _link_entities(self, text, file_path):
+        """
+            Replaces the elements found in a text by links to their entity files in a single pass.
+
+            The text is scanned with the link automaton, or with one regex of the elements of the file if pyahocorasick is not installed.
+            Matches inside existing [[...]] links are skipped, and overlapping matches are resolved by keeping the leftmost, then the longest.
+            An element is only linked if it was counted in this file (see _build_file_index).
+
+            Args:
+                text: The text of the file.
+                file_path: The path of the file in the data folder.
+
+            Returns:
+                The text with the links.
+            """
+        present = set(self._file_to_terms[file_path])
+        # Nothing to link, the text does not need to be scanned
+        if not present:
             return text
-        
-        # Get the original text for display
-        original_text = self.dictionary[word].get("original_text", word.replace("_", " "))
-        
-        # Handle both underscore and space versions
-        patterns = []
-        if "_" in word:
-            # For underscored words, create patterns for both versions
-            space_version = word.replace("_", " ")
-            patterns.append((space_version, word, original_text))  # space version, link to underscore
-            patterns.append((word.replace("_", " "), word, original_text))  # ensure we catch the spaced version
-        else:
-            patterns.append((word, word, original_text))
-        
-        # Also handle possessive versions
-        for pattern_word, link_word, display_text in patterns[:]:  # Copy list to avoid modifying while iterating
-            patterns.append((pattern_word + "'s", link_word, display_text + "'s"))  # possessive version
-            patterns.append((pattern_word + "'", link_word, display_text + "'"))   # alternative possessive
-        
-        for pattern_word, link_word, display_text in patterns:
-            # Escape special regex characters
-            escaped_word = re.escape(pattern_word)
-            # Create word boundary pattern
-            pattern = r'\b' + escaped_word + r'\b'
-            
-            def replacer(match):
-                matched_text = match.group(0)
-                start_pos = match.start()
-                end_pos = match.end()
-                
-                # Check if this match is inside an existing link
-                # Look backwards for [[ and forwards for ]]
-                text_before = text[:start_pos]
-                text_after = text[end_pos:]
-                
-                # Find the last [[ before this position
-                last_open = text_before.rfind('[[')
-                # Find the first ]] after this position  
-                next_close = text_after.find(']]')
-                
-                if last_open != -1:
-                    # Check if there's a ]] between the [[ and our match
-                    text_between = text[last_open:start_pos]
-                    if ']]' not in text_between and next_close != -1:
-                        # We're inside a link, don't replace
-                        return matched_text
-                
-                # Create the exact path format requested
-                link_path = f"ENTITY/{word_type}/{link_word}"
-                return f"[[{link_path}|{matched_text}]]"
-            
-            text = re.sub(pattern, replacer, text, flags=re.IGNORECASE)
-        
+        link_spans = self._link_spans(text)
+        has_links = bool(link_spans[0])
+
+        matches = []
+        if self._link_automaton is None:
+            # The elements of the file with the same text (e.g. "Paris" and "paris") share one
+            # alternative of the regex, the first one in the dictionary is linked
+            surfaces = {}
+            for element in self._file_to_terms[file_path]:
+                surface = element.replace("_", " ").lower()
+                if surface not in surfaces:
+                    surfaces[surface] = self._link_start(element)
+            for match in _terms_pattern(tuple(sorted(surfaces))).finditer(text):
+                link_start = surfaces.get(match.group(1).lower())
+                if link_start is None or (has_links and self._inside_link(link_spans, match.start())):
+                    continue
+                matches.append((match.start(), match.end(), link_start))
+            return self._splice_links(text, matches)
+
+        lowered = self._lower(text)
+        padded = " " + lowered + " "
+        # The \b checks are inlined as in _count_list_words
+        for last, (length, candidates, first_is_word, last_is_word) in self._link_automaton.iter(lowered):
+            start, end = last - length + 1, last + 1
+            before = padded[start]
+            after = padded[end + 1]
+            if (before.isalnum() or before == "_") == first_is_word:
+                continue
+            if has_links and self._inside_link(link_spans, start):
+                continue
+            # Possessives are included in the link. As in _terms_pattern, they are tried first and
+            # the end of the element only has to be a word boundary when there is none (e.g. "U.S.'s")
+            if lowered.startswith("'s", end) and self._is_boundary(lowered, end + 2):
+                end += 2
+            elif lowered.startswith("'", end) and not self._is_boundary(lowered, end + 1):
+                end += 1
+            elif (after.isalnum() or after == "_") == last_is_word:
+                continue
+            for element, link_start in candidates:
+                if element in present:
+                    matches.append((start, end, link_start))
+                    break
+
+        matches.sort(key = lambda match: (match[0], -match[1]))
+        return self._splice_links(text, matches)
+
+    def _link_start(self, element):
+        """Returns the beginning of the links to an element, built once per element rather than once per match"""
+        return f"[[ENTITY/{self.types[element]}/{element}|"
+
+    def _splice_links(self, text, matches):
+        """Builds the linked text from (start, end, link start) matches sorted by position, skipping the ones that overlap a previous match"""
+        chunks = []
+        cursor = 0
+        for start, end, link_start in matches:
+            if start < cursor:
+                continue
+            chunks.append(text[cursor:start])
+            chunks.append(link_start + text[start:end] + "]]")
+            cursor = end
+        chunks.append(text[cursor:])
+        return "".join(chunks)
+
+    def _page_hashes_path(self):
+        """Returns the path of the file keeping the hash and modification time of the viewer pages written by the previous run"""
+        return Path(self.path) / ".cache" / "pages.json"
+
+    def _load_page_hashes(self):
+        """Loads the hashes of the pages written by the previous run (none if the file is missing or cannot be read), see _write_page"""
+        try:
+            self._page_hashes = json.loads(self._page_hashes_path().read_text(encoding = "utf-8"))
+        except (OSError, ValueError):
+            self._page_hashes = {}
+        return self._page_hashes
+
+    def _save_page_hashes(self):
+        """Saves the hashes of the pages written by this run through a temporary file, as in _write_cache_entry, see _write_page"""
+        path = self._page_hashes_path()
+        path.parent.mkdir(parents = True, exist_ok = True)
+        temp_path = path.with_name(path.name + ".tmp")
+        temp_path.write_text(json.dumps(self._page_hashes), encoding = "utf-8")
+        os.replace(temp_path, path)
+
+    def _page_is_current(self, path, digest):
+        """Checks if a page was written from the same digest by a previous run and was not modified or deleted since"""
+        path = path.replace("\"", "").replace("'", "")
+        entry = self._page_hashes.get(path)
+        if entry is None or entry[0] != digest:
+            return False
+        try:
+            return os.stat(path).st_mtime_ns == entry[1]
+        except FileNotFoundError:
+            return False
+
+    def _write_page(self, path, content, digest = None):
+        """
+            Writes a viewer page with _create_file, unless it already has this content.
+
+            The blake2b hash of the content (or the given digest of what the content was built from) and the modification time of the
+            file are kept after each write, so an unchanged page is skipped with a single stat call. A page edited or deleted since the
+            last run is written again.
+
+            Args:
+                path: The path of the page.
+                content: The text of the page.
+                digest: The digest identifying the content, by default the hash of the content.
+
+            Returns:
+                True if the page was written, False if it was skipped.
+            """
+        path = path.replace("\"", "").replace("'", "")
+        # The content is encoded once, for the hash and for the write
+        data = content.encode("utf-8")
+        if digest is None:
+            digest = hashlib.blake2b(data, digest_size = 16).hexdigest()
+        if self._page_is_current(path, digest):
+            return False
+        self._create_file(path, data)
+        self._page_hashes[path] = [digest, os.stat(path).st_mtime_ns]
+        return True
+
+    def _entity_page_path(self, element):
+        """Returns the path of the index card of an element"""
+        return self.viewer_path + "/ENTITY/" + self.types[element] + "/" + element + ".md"
+
+    def _viewer_file_path(self, file_path):
+        """Returns the path of the viewer version of a file of the data folder (.txt files become .md files)"""
+        relative_path = Path(file_path).relative_to(self.data_path)
+        if relative_path.suffix == ".txt":
+            relative_path = relative_path.with_suffix(".md")
+        return os.path.join(self.viewer_path, "FILES", relative_path)
+
+    def _take_raw_text(self, file_path):
+        """Returns the raw text of a file kept by process and releases it, or reads the file again if it was not kept"""
+        text = self._raw_texts.pop(file_path, None)
+        if text is None:
+            text = self._read_text(file_path)
         return text
 
+    def _link_text(self, text, file_path):
+        """Adds the links to the elements that meet the criteria in the text of a file"""
+        # Single pass over the text for all the elements
+        return self._link_entities(text, file_path)
+
+    def _link_digest(self, text, file_path):
+        """Returns the hash of what the linked text of a file is built from: its raw text and the elements (with their types) linked in it"""
+        elements = "\n".join(self.types[element] + "/" + element for element in self._file_to_terms[file_path])
+        return hashlib.blake2b((elements + "\0" + text).encode("utf-8"), digest_size = 16).hexdigest()
+
+    def _texts_to_link(self):
+        """
+            Returns the (path, raw text, digest) of the files whose viewer page has to be written again.
+
+            A file with the same text and the same elements as in the previous run would give the same page,
+            so it is neither linked nor written if its page was not modified since (see _page_is_current).
+            """
+        texts = []
+        for file_path in self._text_files:
+            text = self._take_raw_text(file_path)
+            digest = self._link_digest(text, file_path)
+            if not self._page_is_current(self._viewer_paths[file_path], digest):
+                texts.append((file_path, text, digest))
+        return texts
+
+    def _linked_texts(self, texts):
+        """
+            Yields the path, the linked text and the digest of each (path, raw text, digest) of texts, in order.
+
+            The files are linked in worker processes when there are enough of them to pay for starting them,
+            each worker building its own link automaton from the eligible terms.
+            """
+        if len(texts) >= _PARALLEL_MIN_FILES:
+            with ProcessPoolExecutor(initializer = _init_link_worker, initargs = (self._active_terms, self._file_to_terms)) as executor:
+                linked = executor.map(_link_file, [text for file_path, text, digest in texts], [file_path for file_path, text, digest in texts], chunksize = 4)
+                for (file_path, text, digest), linked_text in zip(texts, linked):
+                    yield file_path, linked_text, digest
+        else:
+            self._link_automaton = self._build_link_automaton([element for element, word_type in self._active_terms])
+            for file_path, text, digest in texts:
+                yield file_path, self._link_text(text, file_path), digest
+
     def generate(self):
         from tqdm import tqdm
-        import spacy
-        print("""Generating the viewer entity files...""")
-        for element in tqdm(self.dictionary):
-            sources = self.dictionary[element]["counts"]
-            total_count = sum(self.dictionary[element]["counts"].values())
-            
+        self._load_page_hashes()
+        # The viewer path of each file is computed once, and all the folders of the viewer
+        # are created before writing the pages
+        self._viewer_paths = {file_path: self._viewer_file_path(file_path) for file_path in self._text_files}
+        self._ensure_dirs([self._entity_page_path(element) for element, word_type in self._active_terms] + list(self._viewer_paths.values()))
+        # The pages are written by a few threads while the next ones are built, with at
+        # most _MAX_PENDING_WRITES pages waiting to be written at a time
+        with ThreadPoolExecutor(max_workers = 8) as writer:
+            pending = deque()
+
+            def write_page(path, content, digest = None):
+                if len(pending) >= _MAX_PENDING_WRITES:
+                    pending.popleft().result()
+                pending.append(writer.submit(self._write_page, path, content, digest))
+
+            print("""Generating the viewer entity files...""")
             # Generate page for items that meet criteria OR are from the word list
-            if (len(sources) >= self.min_sources and total_count >= self.min_count) or self.dictionary[element]["type"] == "LIST":
-                entity_type = self.dictionary[element]["type"]
-                path = self.viewer_path + "/ENTITY/" + entity_type + "/" + element + ".md"
-                
+            for element, entity_type in tqdm(self._active_terms):
+                sources = self.counts[element]
+                path = self._entity_page_path(element)
+            
                 # Use original text with spaces if available, otherwise use the key
-                display_name = self.dictionary[element].get("original_text", element.replace("_", " "))
+                display_name = self.originals.get(element, element.replace("_", " "))
                 content = f"# {display_name}\n\n"
-                
+            
                 if sources:  # Only show sources if there are any
                     content += "## Occurrences\n\n"
-                    for source in self.dictionary[element]["counts"]:
-                        content += f"- {self._create_file_link(source, self._strip_path(source))}: " + str(self.dictionary[element]["counts"][source])+ "\n"
+                    for source, count in sources.items():
+                        content += f"- {self._create_file_link(source, Path(source).stem)}: " + str(count)+ "\n"
                 else:
                     content += "*This term was in your word list but not found in any documents.*\n"
-                
-                self._create_file(path, content)
-        print("""Viewer entity files generated.""")
-        
-        print("""Generating the viewer text files...""")
-        text_files = self._find_text_files(self.data_path)
-        for file_path in tqdm(text_files):
-            with open(file_path, "r", encoding = 'utf-8') as f:
-                text = f.read()
-            
-            # Apply replacements for all dictionary elements that meet criteria
-            for element in self.dictionary:
-                sources = self.dictionary[element]["counts"]
-                total_count = sum(self.dictionary[element]["counts"].values())
-                
-                if (len(sources) >= self.min_sources and total_count >= self.min_count) or self.dictionary[element]["type"] == "LIST":
-                    word_type = self.dictionary[element]["type"]
-                    # Pass current file path to check if term appears in this file
-                    text = self._replace_words(text, element, word_type, file_path)
-
-            # Create the viewer version of the file
-            relative_path = file_path.replace(self.data_path, "")
-            if relative_path.startswith("/"):
-                relative_path = relative_path[1:]
             
-            viewer_path = self.viewer_path + "/FILES/" + relative_path
-            viewer_path = viewer_path.replace(".txt", ".md")
-            
-            self._create_file(viewer_path, text)
+                write_page(path, content)
+            print("""Viewer entity files generated.""")
+        
+            print("""Generating the viewer text files...""")
+            # Only the files that changed (or whose elements changed) since the last run are linked
+            texts = self._texts_to_link()
+            for file_path, text, digest in tqdm(self._linked_texts(texts), total = len(texts)):
+                # Create the viewer version of the file
+                write_page(self._viewer_paths[file_path], text, digest)
+
+            # Wait for the last pages (and raise the errors of the writes, if any)
+            for future in pending:
+                future.result()
         
+        self._save_page_hashes()
         print("""Viewer text files generated.""")
 
 
+# Worker processes of Corpus.process only hold the word list, not the SpaCy model
+_worker_corpus = None
+
+def _init_prepare_worker(word_list):
+    global _worker_corpus
+    _worker_corpus = Corpus.__new__(Corpus)
+    _worker_corpus.word_list = word_list
+    _worker_corpus._word_automaton = _worker_corpus._build_word_list_automaton()
+    _worker_corpus._word_regex = _worker_corpus._build_word_list_regex() if _worker_corpus._word_automaton is None else None
+
+def _prepare_file(text_file):
+    return _worker_corpus._prepare_file(text_file)
+
+# Worker processes of Corpus.generate only hold the eligible terms and the terms of each file
+def _init_link_worker(active_terms, file_to_terms):
+    global _worker_corpus
+    _worker_corpus = Corpus.__new__(Corpus)
+    _worker_corpus.types = dict(active_terms)
+    _worker_corpus._file_to_terms = file_to_terms
+    _worker_corpus._link_automaton = _worker_corpus._build_link_automaton([element for element, word_type in active_terms])
+
+def _link_file(text, file_path):
+    return _worker_corpus._link_text(text, file_path)
+
+
 def main():
     # The main function calls the corpus class with the desired parameters.
     corpus = Corpus("Cybermeneutics_corpus", # 
@@ -737,4 +1211,7 @@ def main():
                 )
 
 if __name__ == "__main__":
+    # SpaCy worker processes are started with "spawn" rather than "fork", which
+    # avoids pickling errors with transformer models (and CUDA).
+    mp.set_start_method("spawn", force = True)
     main()
\ No newline at end of file